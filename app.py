@@ -8,7 +8,8 @@ import numpy as np
 import csv
 import io
 import re
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure  # no pyplot state: nothing to close or leak per rerun
 from datetime import datetime, timedelta, timezone
 from suntime import Sun
 from pypdf import PdfReader
@@ -1942,7 +1943,8 @@ def build_trend_png(total_over_time, by_flag_over_time, title):
     """
     Renders trend tables as a PNG image (two panels).
     """
-    fig, axes = plt.subplots(2, 1, figsize=(12, 8), constrained_layout=True)
+    fig = Figure(figsize=(12, 8), constrained_layout=True)
+    axes = fig.subplots(2, 1)
 
     total_over_time.plot(ax=axes[0], legend=False, linewidth=2)
     axes[0].set_title(f"{title} - Total")
@@ -1961,7 +1963,6 @@ def build_trend_png(total_over_time, by_flag_over_time, title):
 
     png_buffer = io.BytesIO()
     fig.savefig(png_buffer, format="png", dpi=180)
-    plt.close(fig)
     png_buffer.seek(0)
     return png_buffer.getvalue()
 
@@ -1970,7 +1971,8 @@ def build_daily_variable_flag_pct_png(pct_pivot, title):
     Renders a daily variable-level percentage trend chart as a PNG.
     Expects columns to represent flags for a single variable.
     """
-    fig, ax = plt.subplots(figsize=(13, 6), constrained_layout=True)
+    fig = Figure(figsize=(13, 6), constrained_layout=True)
+    ax = fig.subplots()
     pct_pivot.plot(ax=ax, linewidth=1.5)
     ax.set_title(title)
     ax.set_xlabel("Date")
@@ -1984,10 +1986,33 @@ def build_daily_variable_flag_pct_png(pct_pivot, title):
 
     png_buffer = io.BytesIO()
     fig.savefig(png_buffer, format="png", dpi=180)
-    plt.close(fig)
     png_buffer.seek(0)
     return png_buffer.getvalue()
 
+def minmax_downsample_positions(values, n_buckets=2000):
+    """
+    Returns sorted positions of the min and max value in each of n_buckets
+    equal-width buckets (plus the endpoints), for drawing long series.
+    Keeps the visual envelope of the line while drawing far fewer vertices.
+    Expects values without NaN.
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    # Pad with the last value so every bucket is full; argmin/argmax return the
+    # first occurrence, so a padded position is never picked over a real one
+    padded = np.pad(values, (0, size * n_buckets - n), mode='edge').reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    positions = np.concatenate([
+        offsets + padded.argmin(axis=1),
+        offsets + padded.argmax(axis=1),
+        [0, n - 1],
+    ])
+    return np.unique(np.minimum(positions, n - 1))
+
 def build_15min_variable_flag_overlay_png(df_viz, filtered_flags, variable, title, start_ts=None, end_ts=None):
     """
     Render a 15-minute variable time series with flagged points overlaid by flag code.
@@ -2023,11 +2048,21 @@ def build_15min_variable_flag_overlay_png(df_viz, filtered_flags, variable, titl
             how='left'
         ).dropna(subset=['TIMESTAMP', 'Value'])
 
-    fig, ax = plt.subplots(figsize=(13, 5.5), constrained_layout=True)
-    ax.plot(base['TIMESTAMP'], base['Value'], color="#5a5a5a", linewidth=1.1, label=variable)
+    fig = Figure(figsize=(13, 5.5), constrained_layout=True)
+    ax = fig.subplots()
+    # Draw the line from a min/max-downsampled copy; a year of 15-minute samples
+    # is far more vertices than the image has pixels. Flagged points stay exact.
+    line_pos = minmax_downsample_positions(base['Value'].to_numpy())
+    ax.plot(
+        base['TIMESTAMP'].to_numpy()[line_pos],
+        base['Value'].to_numpy()[line_pos],
+        color="#5a5a5a",
+        linewidth=1.1,
+        label=variable
+    )
 
     if not points.empty:
-        cmap = plt.cm.get_cmap('tab10')
+        cmap = matplotlib.colormaps['tab10']
         for i, flag_code in enumerate(sorted(points['flag'].dropna().astype(str).unique().tolist())):
             pf = points[points['flag'] == flag_code]
             if pf.empty:
@@ -2049,7 +2084,6 @@ def build_15min_variable_flag_overlay_png(df_viz, filtered_flags, variable, titl
 
     png_buffer = io.BytesIO()
     fig.savefig(png_buffer, format="png", dpi=180)
-    plt.close(fig)
     png_buffer.seek(0)
     return png_buffer.getvalue()
 
@@ -4496,7 +4530,8 @@ def main():
                                     flag_counts_save.to_excel(writer, sheet_name="Flag Percentages", index=False)
 
                                 pct_plot_df = flag_counts_save.sort_values("Pct_of_Total_Rows", ascending=False)
-                                fig, ax = plt.subplots(figsize=(10, 4.8))
+                                fig = Figure(figsize=(10, 4.8))
+                                ax = fig.subplots()
                                 ax.bar(pct_plot_df["Flag"], pct_plot_df["Pct_of_Total_Rows"])
                                 ax.set_ylabel("% of Total Rows")
                                 ax.set_xlabel("Flag")
@@ -4507,7 +4542,6 @@ def main():
                                 fig.savefig(pct_png_buffer, format="png", dpi=180)
                                 pct_png_buffer.seek(0)
                                 pct_png_bytes = pct_png_buffer.getvalue()
-                                plt.close(fig)
 
                                 with open(pct_png_path, "wb") as f:
                                     f.write(pct_png_bytes)
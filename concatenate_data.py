@@ -1,11 +1,18 @@
 import pandas as pd
 import os
 import csv
-import warnings
+import io
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-# Suppress ffill/bfill warnings
-warnings.simplefilter(action='ignore', category=FutureWarning)
+from modules.utils import NA_VALUES, SENTINEL_VALUES, arrow_null_values, write_csv_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pac  # multi-threaded CSV reader
+except ImportError:
+    pa = None
+    pac = None
 
 # File paths
 file_2023 = 'data/02FW005_raw_CR350_1379_20231102.csv'
@@ -22,6 +29,13 @@ Field_time_out_2 = "2024-05-24 09:10"
 Field_time_in_3 = "2025-05-21 09:48"
 Field_time_out_3 = "2025-05-21 10:55"
 
+# Field visit windows (time in, time out)
+FIELD_VISITS = [
+    (Field_time_in_1, Field_time_out_1),
+    (Field_time_in_2, Field_time_out_2),
+    (Field_time_in_3, Field_time_out_3)
+]
+
 # Config: Year -> (Data ID number, raw_file_path)
 year_config = {
     2023: {'id_num': 222, 'path': file_2023},
@@ -73,7 +87,13 @@ column_unit_rename = {
     "mbar": "hPa"
 }
 
-def parse_toa5_header(filepath):
+# Metadata columns added by read_data (text, never flagged)
+META_COLS = ['Data_ID', 'Station_ID', 'Logger_ID', 'Logger_Script', 'Logger_Software']
+
+# Every flag value the concatenation step can produce
+FLAG_CATEGORIES = ['', 'M', 'ERR', 'V', 'M, V', 'ERR, V']
+
+def parse_toa5_header(line):
     """
     Parses the first line of a TOA5 file to extract:
     Model, Serial, OS, ProgramName.
@@ -89,46 +109,74 @@ def parse_toa5_header(filepath):
     }
     
     try:
-        if not os.path.exists(filepath):
-            print(f"File not found: {filepath}")
-            return meta
-
-        with open(filepath, 'r') as f:
-            line = f.readline().strip()
-            # Split by comma, strip quotes
-            parts = [p.strip().strip('"') for p in line.split(',')]
-            
-            # Expecting 8 parts for standard TOA5
-            # 0: Format (TOA5)
-            # 1: StationName (Logger)
-            # 2: Model (CR350)
-            # 3: Serial (1379)
-            # 4: OS (CR350.Std.01.00)
-            # 5: Program (CPU:...)
-            # 6: Sig
-            # 7: Table
+        # csv.reader strips the quotes and keeps quoted commas inside a field
+        parts = [p.strip() for p in next(csv.reader([line]), [])]
+        
+        # Expecting 8 parts for standard TOA5
+        # 0: Format (TOA5)
+        # 1: StationName (Logger)
+        # 2: Model (CR350)
+        # 3: Serial (1379)
+        # 4: OS (CR350.Std.01.00)
+        # 5: Program (CPU:...)
+        # 6: Sig
+        # 7: Table
+        
+        if len(parts) >= 6:
+            model = parts[2]
+            serial = parts[3]
+            os_ver = parts[4]
+            prog_name = parts[5]
             
-            if len(parts) >= 6:
-                model = parts[2]
-                serial = parts[3]
-                os_ver = parts[4]
-                prog_name = parts[5]
-                
-                # Construct IDs
-                meta['logger_id'] = f"{model}-{serial}"
-                meta['logger_software'] = f"{model}-{serial}-{os_ver}"
-                # Using Program Name as version for now as requested format implies station/version logic
-                # Format requested: model-serial-station-version
-                # We have STATION_ID global. 
-                # Program name example: CPU:CheslattaLake_CR350_20230629.CRB
-                # Just use the full prog name as 'version' component
-                meta['logger_script'] = f"{model}-{serial}-{STATION_ID}-{prog_name}"
+            # Construct IDs
+            meta['logger_id'] = f"{model}-{serial}"
+            meta['logger_software'] = f"{model}-{serial}-{os_ver}"
+            # Using Program Name as version for now as requested format implies station/version logic
+            # Format requested: model-serial-station-version
+            # We have STATION_ID global. 
+            # Program name example: CPU:CheslattaLake_CR350_20230629.CRB
+            # Just use the full prog name as 'version' component
+            meta['logger_script'] = f"{model}-{serial}-{STATION_ID}-{prog_name}"
                 
     except Exception as e:
-        print(f"Warning: Could not parse header for {filepath}: {e}")
+        print(f"Warning: Could not parse TOA5 header line: {e}")
         
     return meta
 
+def read_toa5_body(filepath, header_list):
+    """
+    Reads the data rows of a TOA5 file (everything after the 4 header lines)
+    using the column names from the header row.
+    Uses the PyArrow CSV reader when available (multi-threaded). Only
+    TIMESTAMP is typed there; every other column is read as text and converted
+    by coerce_numeric_columns, so text values are still flagged ERR and
+    sentinels like -7999.0 still become missing. Falls back to the pandas C
+    engine if pyarrow is not installed or cannot parse the file.
+    """
+    if pac is not None:
+        column_types = {col: pa.string() for col in header_list}
+        if 'TIMESTAMP' in header_list:
+            # Keep nanosecond precision like pd.to_datetime
+            column_types['TIMESTAMP'] = pa.timestamp('ns')
+        try:
+            table = pac.read_csv(
+                filepath,
+                read_options=pac.ReadOptions(skip_rows=4, column_names=header_list, block_size=8 << 20),
+                parse_options=pac.ParseOptions(delimiter=','),
+                convert_options=pac.ConvertOptions(
+                    null_values=arrow_null_values(),
+                    strings_can_be_null=True,
+                    column_types=column_types
+                )
+            )
+            return table.to_pandas(self_destruct=True, split_blocks=True)
+        except pa.ArrowInvalid as e:
+            print(f"Warning: PyArrow could not parse {filepath} ({e}); reading it with pandas")
+
+    return pd.read_csv(filepath, skiprows=4, header=None, names=header_list,
+                       na_values=NA_VALUES, keep_default_na=True,
+                       skipinitialspace=True, low_memory=False)
+
 def read_data(year, config_entry):
     filepath = config_entry['path']
     id_num = config_entry['id_num']
@@ -139,41 +187,39 @@ def read_data(year, config_entry):
         print(f"Skipping {year}: File not found {filepath}")
         return pd.DataFrame(), {}, {}
 
-    # 1. Parse Metadata
-    meta = parse_toa5_header(filepath)
+    # 1. Read the 4 TOA5 header lines in one pass:
+    # Line 0: Environment, Line 1: Header, Line 2: Units, Line 3: Process Codes
+    with open(filepath, 'r', newline='') as f:
+        toa5_line = f.readline()
+        header_line = f.readline()
+        units_line = f.readline()
+        f.readline()  # process codes, not used
     
-    # 2. Read Units (Row 2, index 2 if 0-based lines)
-    try:
-        units_df = pd.read_csv(filepath, header=None, skiprows=2, nrows=1)
-        units_list = units_df.iloc[0].mask(pd.isna, "").tolist()
-    except Exception as e:
-        print(f"Error reading units: {e}")
-        units_list = []
-
-    # 3. Read Header (Row 1, index 1)
-    try:
-        header_df = pd.read_csv(filepath, header=None, skiprows=1, nrows=1)
-        header_list = header_df.iloc[0].tolist()
-    except Exception as e:
-        print(f"Error reading header: {e}")
+    # 2. Parse Metadata
+    meta = parse_toa5_header(toa5_line)
+    
+    # 3. Parse Header (Row 1)
+    header_list = next(csv.reader([header_line]), [])
+    if not header_list:
+        print(f"Error reading header: no column names in {filepath}")
         return pd.DataFrame(), {}, meta
     
+    # 4. Parse Units (Row 2)
+    units_list = next(csv.reader([units_line]), [])
+    
     if len(units_list) < len(header_list):
         units_list += [""] * (len(header_list) - len(units_list))
     
     units_map = dict(zip(header_list, units_list))
     
-    # 4. Read Data
-    # Skip TOA5 header (0), Units (2), Type (3). Keep Header (1).
-    df = pd.read_csv(filepath, skiprows=[0, 2, 3], 
-                     na_values=['NAN', '"NAN"', '', '-7999', '7999'], 
-                     keep_default_na=True, skipinitialspace=True, low_memory=False)
+    # 5. Read Data
+    df = read_toa5_body(filepath, header_list)
     
     # robustly parse timestamp
     if 'TIMESTAMP' in df.columns:
         df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'])
     
-    # 5. Add Metadata Columns
+    # 6. Add Metadata Columns
     # Data ID: Just the number (string) as requested
     df['Data_ID'] = str(id_num)
     df['Station_ID'] = STATION_ID
@@ -183,6 +229,50 @@ def read_data(year, config_entry):
     
     return df, units_map, meta
 
+def coerce_numeric_columns(df, skip_cols):
+    """
+    Converts every data column (not in skip_cols) to numbers.
+    Logger sentinels (SENTINEL_VALUES) become NaN whatever their spelling
+    (-7999, -7999.0, ...). Values that are present but not numeric (text,
+    etc.) are stored as +inf, so they are still flagged ERR after
+    concatenation and resampling.
+    """
+    for col in df.columns:
+        if col in skip_cols:
+            continue
+        raw = df[col]
+        if pd.api.types.is_numeric_dtype(raw):
+            numeric = raw
+            not_numeric = None
+        else:
+            numeric = pd.to_numeric(raw, errors='coerce')
+            not_numeric = raw.notna() & (raw != "") & numeric.isna()
+        is_sentinel = numeric.isin(SENTINEL_VALUES)
+        if is_sentinel.any() or (not_numeric is not None and not_numeric.any()):
+            numeric = numeric.astype('float64').mask(is_sentinel, np.nan)
+            if not_numeric is not None:
+                numeric = numeric.mask(not_numeric, np.inf)
+        df[col] = numeric
+    return df
+
+def field_visit_mask(timestamps):
+    """
+    Returns a boolean array marking rows that fall inside any field visit.
+    Visit start is rounded down and visit end rounded up to the 15T grid.
+    """
+    ts = timestamps.to_numpy()
+    visit_mask = np.zeros(len(ts), dtype=bool)
+    
+    for start_str, end_str in FIELD_VISITS:
+        try:
+            t_start_rounded = pd.Timestamp(start_str).floor('15min').to_datetime64()
+            t_end_rounded = pd.Timestamp(end_str).ceil('15min').to_datetime64()
+            visit_mask |= (ts >= t_start_rounded) & (ts <= t_end_rounded)
+        except Exception as e:
+            print(f"Warning: Could not process field visit time {start_str}-{end_str}: {e}")
+    
+    return visit_mask
+
 def main():
     # Store all dataframes and metadata
     dfs = []
@@ -190,9 +280,13 @@ def main():
     latest_meta = {} 
     
     # 1. Process each file
-    for year in sorted(year_config.keys()):
-        cfg = year_config[year]
-        df, units, meta = read_data(year, cfg)
+    # The reads are independent and mostly I/O + parsing, so run them concurrently
+    with ThreadPoolExecutor(max_workers=len(year_config)) as ex:
+        futures = {year: ex.submit(read_data, year, cfg) for year, cfg in year_config.items()}
+        results = {year: fut.result() for year, fut in futures.items()}
+
+    for year in sorted(results.keys()):
+        df, units, meta = results[year]
         
         if df.empty:
             continue
@@ -217,8 +311,12 @@ def main():
         return
 
     # 2. Concatenate
+    # Align columns and cast data columns to float first, so concat is a
+    # block copy instead of upcasting mismatched columns to object.
     print("Concatenating datasets...")
-    df_all = pd.concat(dfs, ignore_index=True)
+    all_cols = list(dict.fromkeys(c for df in dfs for c in df.columns))
+    dfs = [coerce_numeric_columns(df.reindex(columns=all_cols), ['TIMESTAMP'] + META_COLS) for df in dfs]
+    df_all = pd.concat(dfs, ignore_index=True, copy=False)
     print(f"Total records: {len(df_all)}")
 
     df_all = df_all.rename(columns=column_rename)
@@ -235,37 +333,34 @@ def main():
     if 'TIMESTAMP' not in df_all.columns:
         raise ValueError("TIMESTAMP column missing!")
     
-    # Already converted in read_data, but good to ensure
-    # df_all['TIMESTAMP'] = pd.to_datetime(df_all['TIMESTAMP'])
-    df_all = df_all.sort_values('TIMESTAMP')
-    
-    # Deduplicate
+    # Deduplicate (first record in file order wins), then sort once on the index
     df_all = df_all.drop_duplicates(subset=['TIMESTAMP'], keep='first')
     
-    df_all = df_all.set_index('TIMESTAMP')
+    df_all = df_all.set_index('TIMESTAMP').sort_index()
     
     # 4. Resample (Gap Filling)
-    print("Resampling to 15T...")
-    # Resample to 15T, insert NaNs
-    df_resampled = df_all.resample('15T').asfreq()
+    print("Resampling to 15min...")
+    # Reindex onto the regular 15-minute grid, inserting NaN rows for gaps.
+    # The grid spans the same labels resample('15min').asfreq() would produce.
+    grid = pd.date_range(df_all.index[0].floor('15min'), df_all.index[-1].floor('15min'),
+                         freq='15min', name='TIMESTAMP')
+    df_resampled = df_all.reindex(grid)
     
     # 5. Construct Flags
     # Identify data columns (exclude metadata columns we just added)
-    meta_cols = ['Data_ID', 'Station_ID', 'Logger_ID', 'Logger_Script', 'Logger_Software']
+    meta_cols = META_COLS
     data_cols = [c for c in df_resampled.columns if c not in meta_cols and c != 'RECORD']
     
     # Create final DataFrame with ordering
     df_final = df_resampled.reset_index()
     
     # Fill text metadata for gap-filled rows
-    df_final['Station_ID'] = df_final['Station_ID'].fillna(STATION_ID)
+    # Station_ID is a constant for this script
+    df_final['Station_ID'] = STATION_ID
     
-    # Ffill metadata
-    for mc in meta_cols:
-        if mc in df_final.columns:
-            df_final[mc] = df_final[mc].fillna(method='ffill')
-            # If start of file has na (resampling before first record?), bfill
-            df_final[mc] = df_final[mc].fillna(method='bfill')
+    # Ffill metadata (then bfill in case the grid starts before the first record)
+    present_meta_cols = [mc for mc in meta_cols if mc in df_final.columns]
+    df_final[present_meta_cols] = df_final[present_meta_cols].ffill().bfill()
     
     # Now construct column list
     final_col_order = ['TIMESTAMP', 'RECORD'] + data_cols + meta_cols
@@ -276,6 +371,7 @@ def main():
     
     # Add Flags
     cols_to_write = []
+    flag_src_cols = [] # Columns that get a companion _Flag column
     
     # Preparing the header rows lists
     row_headers = [] # Row 1
@@ -299,100 +395,62 @@ def main():
         # Flag Column
         if col not in ['TIMESTAMP'] + meta_cols:
             flag_col = f"{col}_Flag"
-            df_final[flag_col] = ""
+            flag_src_cols.append(col)
             cols_to_write.append(flag_col)
             
-            # Set ERR flag logic
-            # We want to flag ANY value that is present but not a valid number (INF, text, etc) as ERR
-            # 1. Convert to numeric, coercing errors to NaN
-            # Keep original to check what was there before
-            original_series = df_final[col].copy()
-            numeric_series = pd.to_numeric(df_final[col], errors='coerce')
-            
-            # 2. Identify values that became NaN but were NOT NaN/empty originally
-            # These are "bad values" (Text, INF, Name?, etc.)
-            # Note: pd.to_numeric handles "INF" by default depending on version, 
-            # so we might need to explicitly check infinite if it doesn't coerce them to NaN.
-            # But usually we want INF to be NaN + ERR too.
-            
-            # Check for infinity in the numeric series (if it wasn't coerced)
-            is_infinite = np.isinf(numeric_series)
-            
-            # Check for coercion failures (was valid-ish string, became NaN)
-            # We need to be careful with empty strings being "NaN" in pandas read_csv
-            # If it was already NaN, it's Missing (M), not Error.
-            was_not_nan = original_series.notna() & (original_series != "")
-            became_nan = numeric_series.isna()
-            
-            # ERR condition: (Is Infinite) OR (Was Not NaN AND Became NaN when coerced)
-            mask_err = is_infinite | (was_not_nan & became_nan)
-            
-            if mask_err.any():
-                df_final.loc[mask_err, flag_col] = "ERR"
-                # Standardize to NaN
-                numeric_series[mask_err] = np.nan
-            
-            # Apply the numeric series to the dataframe
-            df_final[col] = numeric_series
-
-            # Set M flag
-            # Only apply M to NaNs that are NOT already flagged as ERR
-            mask_nan = df_final[col].isna()
-            # If it's NaN now, and NOT ERR, then it's Missing
-            mask_m = mask_nan & (df_final[flag_col] != "ERR")
-            df_final.loc[mask_m, flag_col] = "M"
-
-            # Set V flag (Field Visits)
-            # Parse and round field visits
-            # (Ideally define this list outside loop for efficiency, but let's keep it robust and simple here)
-            field_visits = [
-                (Field_time_in_1, Field_time_out_1),
-                (Field_time_in_2, Field_time_out_2),
-                (Field_time_in_3, Field_time_out_3)
-            ]
-
-            for start_str, end_str in field_visits:
-                # Parse
-                try:
-                    t_start = pd.to_datetime(start_str)
-                    t_end = pd.to_datetime(end_str)
-                    
-                    # Round down start to nearest 15T
-                    t_start_rounded = t_start.floor('15T')
-                    
-                    # Round up end to nearest 15T
-                    t_end_rounded = t_end.ceil('15T')
-                    
-                    # Apply mask
-                    mask_visit = (df_final['TIMESTAMP'] >= t_start_rounded) & (df_final['TIMESTAMP'] <= t_end_rounded)
-                    
-                    # Append V flag instead of overwriting
-                    # Identify rows with existing flags (e.g. "M") within the mask
-                    mask_existing = mask_visit & (df_final[flag_col] != "")
-                    df_final.loc[mask_existing, flag_col] = df_final.loc[mask_existing, flag_col] + ", V"
-                    
-                    # Identify rows with empty flags within the mask
-                    mask_empty = mask_visit & (df_final[flag_col] == "")
-                    df_final.loc[mask_empty, flag_col] = "V"
-                        
-                except Exception as e:
-                    print(f"Warning: Could not process field visit time {start_str}-{end_str}: {e}")
-                
             # Add headers for flag col
             row_headers.append(flag_col)
             row_units.append("") 
+    
+    # Set V flag (Field Visits)
+    visit_mask = field_visit_mask(df_final['TIMESTAMP'])
+    
+    if flag_src_cols:
+        # Build every flag column in one pass over the 2-D block of data columns.
+        # ERR: value present but not a valid number (INF, text, etc.) -> standardized to NaN
+        # M:   value missing (NaN) and not already ERR
+        # V:   row inside a field visit, appended to ERR/M if present
+        # Data columns are already numeric (coerce_numeric_columns);
+        # values that were present but not numbers were stored as inf.
+        values = df_final[flag_src_cols].to_numpy(dtype='float64')
+        
+        mask_err = np.isinf(values)
+        mask_m = np.isnan(values)
+        mask_v = np.broadcast_to(visit_mask[:, None], values.shape)
+        
+        # Flags are stored as categorical codes into FLAG_CATEGORIES
+        flag_codes = np.select(
+            [mask_err & mask_v, mask_m & mask_v, mask_err, mask_m, mask_v],
+            [5, 4, 2, 1, 3],
+            default=0
+        )
+        
+        # Apply the numeric block (ERR values standardized to NaN), reusing
+        # the extracted array instead of building a masked copy of the frame
+        values[mask_err] = np.nan
+        df_final[flag_src_cols] = values
+        
+        # Attach all flag columns at once rather than growing df_final per column
+        flag_frame = pd.DataFrame(
+            {f"{col}_Flag": pd.Categorical.from_codes(flag_codes[:, j], categories=FLAG_CATEGORIES)
+             for j, col in enumerate(flag_src_cols)},
+            index=df_final.index
+        )
+        df_final = pd.concat([df_final, flag_frame], axis=1, copy=False)
             
     # Reorder df_final
     df_final = df_final[cols_to_write]
     
     # Save
     print(f"Saving to {output_file}...")
-    with open(output_file, 'w', newline='') as f:
-        writer = csv.writer(f)
+    with open(output_file, 'wb') as f:
+        header = io.StringIO()
+        writer = csv.writer(header)
         writer.writerow(row_headers)
         writer.writerow(row_units)
+        f.write(header.getvalue().encode('utf-8'))
         
-    df_final.to_csv(output_file, mode='a', header=False, index=False, na_rep='NaN')
+        write_csv_rows(df_final, f)
     print("Done!")
 
 if __name__ == "__main__":
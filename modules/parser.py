@@ -1,6 +1,57 @@
+import csv
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from modules.utils import NA_VALUES, SENTINEL_VALUES, arrow_null_values
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pac
+except ImportError:
+    pa = None
+    pac = None
+
+DEFAULT_SKIP_ROWS = [0, 2, 3]
+HEADER_LINES = 4
+
+def _read_body_arrow(uploaded_file):
+    """
+    Reads the data rows of a standard TOA5 upload with the PyArrow CSV reader.
+    Row 0 is skipped, Row 1 gives the column names, Rows 2-3 (units, codes) are skipped.
+    The result matches pd.read_csv(na_values=NA_VALUES): sentinels in number
+    columns are missing whatever their spelling, dates/times outside TIMESTAMP
+    stay text and all-missing columns are float.
+    """
+    data = uploaded_file.getvalue()
+    read_options = pac.ReadOptions(skip_rows=1, skip_rows_after_names=2)
+    convert_options = pac.ConvertOptions(
+        null_values=arrow_null_values(),
+        strings_can_be_null=True
+    )
+    table = pac.read_csv(pa.BufferReader(data), read_options=read_options, convert_options=convert_options)
+    
+    # pandas does not infer dates or times; read those columns again as text
+    text_cols = [f.name for f in table.schema if f.name != 'TIMESTAMP' and pa.types.is_temporal(f.type)]
+    if text_cols:
+        convert_options.column_types = {col: pa.string() for col in text_cols}
+        table = pac.read_csv(pa.BufferReader(data), read_options=read_options, convert_options=convert_options)
+    
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    
+    df = table.to_pandas(self_destruct=True, split_blocks=True, coerce_temporal_nanoseconds=True)
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            is_sentinel = df[col].isin(SENTINEL_VALUES)
+            if is_sentinel.any():
+                df[col] = df[col].mask(is_sentinel)
+        elif df[col].dtype == object:
+            # Missing text is NaN in pandas, not None
+            df[col] = df[col].fillna(np.nan)
+    return df
+
 def parse_toa5(uploaded_file, skip_rows=None):
     """
     Parses a Campbell Scientific TOA5 file.
@@ -22,7 +73,7 @@ def parse_toa5(uploaded_file, skip_rows=None):
         if skip_rows is None:
             # Skip 0 (info), 2 (units), 3 (codes)
             # Line 1 is header
-            skip_rows = [0, 2, 3]
+            skip_rows = DEFAULT_SKIP_ROWS
             
         # We need to extract Units (Line 2) before we skip it.
         # This requires reading the file twice or reading lines manually first.
@@ -30,23 +81,31 @@ def parse_toa5(uploaded_file, skip_rows=None):
         
         # 1. Extract Header Info
         uploaded_file.seek(0)
-        # Read first 4 lines
-        header_lines = [uploaded_file.readline().decode('utf-8').strip().replace('"','') for _ in range(4)]
+        # Read the first 4 lines in bulk (more blocks only for very wide headers)
+        head = b""
+        while head.count(b"\n") < HEADER_LINES:
+            chunk = uploaded_file.read(8192)
+            if not chunk:
+                break
+            head += chunk
+        # csv.reader handles quoted fields (including ones containing commas)
+        header_rows = list(csv.reader(head.decode('utf-8', errors='replace').splitlines()[:HEADER_LINES]))
+        header_rows += [[]] * (HEADER_LINES - len(header_rows))
         
         # Line 0: Environment Info
         # TOA5, Station, LoggerModel, Serial, OS, Program, Sig, Table
-        env_parts = header_lines[0].split(',')
+        env_parts = header_rows[0]
         header_info = {
             "logger_model": env_parts[2] if len(env_parts) > 2 else "Unknown",
             "logger_serial": env_parts[3] if len(env_parts) > 3 else "Unknown"
         }
 
         # Line 1: Columns
-        columns = header_lines[1].split(',')
+        columns = header_rows[1]
         # Line 2: Units
-        units = header_lines[2].split(',')
+        units = header_rows[2]
         # Line 3: Process Codes
-        process_codes = header_lines[3].split(',')
+        process_codes = header_rows[3]
         
         # Create metadata map {Column: Unit}
         # Handle cases where lengths might mismatch
@@ -55,8 +114,13 @@ def parse_toa5(uploaded_file, skip_rows=None):
             metadata = dict(zip(columns, units))
         
         # 2. Parse DataFrame
+        # Arrow only handles the standard layout (it skips leading rows by count);
+        # custom skip lists go through pandas.
         uploaded_file.seek(0) # Reset pointer
-        df = pd.read_csv(uploaded_file, skiprows=skip_rows)
+        if pac is not None and list(skip_rows) == DEFAULT_SKIP_ROWS and hasattr(uploaded_file, "getvalue"):
+            df = _read_body_arrow(uploaded_file)
+        else:
+            df = pd.read_csv(uploaded_file, skiprows=skip_rows, na_values=NA_VALUES)
         
         # Convert TIMESTAMP to datetime
         if 'TIMESTAMP' in df.columns:
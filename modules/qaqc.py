@@ -1,10 +1,66 @@
 import pandas as pd
 import numpy as np
 
+try:
+    from numba import njit, prange  # optional: compiled QC kernel
+except ImportError:
+    njit = None
+
 DEFAULT_THRESHOLDS = {
     "RH": {"min": 0, "max": 100}
 }
 
+# Flag code bits: 1 = Low, 2 = High, 4 = Rate
+QC_LOW = 1
+QC_HIGH = 2
+QC_RATE = 4
+
+# Flag string for each of the 8 possible codes
+QC_FLAG_LABELS = np.array(
+    [" ".join(name for bit, name in ((QC_LOW, "Low"), (QC_HIGH, "High"), (QC_RATE, "Rate")) if code & bit)
+     for code in range(8)],
+    dtype=object
+)
+
+if njit is not None:
+    @njit(parallel=True, nogil=True)
+    def _qc_codes_kernel(data, mins, maxs, rates, out):
+        # data is (n_cols, n_rows); one column per parallel task.
+        # Runs without the GIL so callers may also use it from threads.
+        for j in prange(data.shape[0]):
+            prev = np.nan
+            for i in range(data.shape[1]):
+                v = data[j, i]
+                code = 0
+                if v < mins[j]:
+                    code |= QC_LOW
+                if v > maxs[j]:
+                    code |= QC_HIGH
+                if abs(v - prev) > rates[j]:
+                    code |= QC_RATE
+                out[j, i] = code
+                prev = v
+else:
+    _qc_codes_kernel = None
+
+def _qc_codes(data, mins, maxs, rates):
+    """
+    Computes the QC flag code (Low/High/Rate bits) for every value.
+    data is a float64 array of shape (n_cols, n_rows); limits are per column,
+    with +/-inf meaning "no limit". NaN values are never flagged.
+    """
+    if _qc_codes_kernel is not None:
+        codes = np.empty(data.shape, dtype=np.uint8)
+        _qc_codes_kernel(data, mins, maxs, rates, codes)
+        return codes
+
+    codes = (data < mins[:, None]).astype(np.uint8) * QC_LOW
+    codes |= (data > maxs[:, None]).astype(np.uint8) * QC_HIGH
+    # Absolute difference to the previous sample (first row has none)
+    diff = np.abs(np.diff(data, axis=1, prepend=np.nan))
+    codes |= (diff > rates[:, None]).astype(np.uint8) * QC_RATE
+    return codes
+
 def apply_qc(df, station_config):
     """
     Applies QA/QC flags to the dataframe based on station_config thresholds.
@@ -12,20 +68,17 @@ def apply_qc(df, station_config):
     """
     df_qc = df.copy()
     thresholds = station_config.get("thresholds", {})
-    
-    # Iterate over each column configured for QC
-    for col, rules in thresholds.items():
-        if col not in df_qc.columns:
-            continue
-            
-        # Initialize Flag Column
-        flag_col = f"{col}_Flag"
-        df_qc[flag_col] = "" 
-        
-        # We need numeric data for checks
-        # Force numeric, coercing errors to NaN
-        series = pd.to_numeric(df_qc[col], errors='coerce')
-        
+
+    # Columns configured for QC that exist in the data
+    qc_cols = [col for col in thresholds if col in df_qc.columns]
+    if not qc_cols:
+        return df_qc
+
+    # Per-column limits; a missing limit becomes +/-inf so it never triggers
+    mins, maxs, rates = [], [], []
+    for col in qc_cols:
+        rules = thresholds[col]
+
         # 1. Range Check (Min/Max)
         min_val = rules.get("min")
         max_val = rules.get("max")
@@ -36,23 +89,24 @@ def apply_qc(df, station_config):
                 min_val = DEFAULT_THRESHOLDS[col]["min"]
             if max_val is None:
                 max_val = DEFAULT_THRESHOLDS[col]["max"]
-        
-        if min_val is not None:
-             df_qc.loc[series < min_val, flag_col] += "Low "
-             
-        if max_val is not None:
-             df_qc.loc[series > max_val, flag_col] += "High "
-
 
         # 2. Rate of Change Check
         rate_val = rules.get("rate_of_change")
-        if rate_val is not None:
-             # Calculate absolute difference
-             diff = series.diff().abs()
-             # Flag where diff exceeds rate
-             df_qc.loc[diff > rate_val, flag_col] += "Rate "
-             
-        # Cleanup: Strip trailing spaces
-        df_qc[flag_col] = df_qc[flag_col].str.strip()
-        
+
+        mins.append(-np.inf if min_val is None else min_val)
+        maxs.append(np.inf if max_val is None else max_val)
+        rates.append(np.inf if rate_val is None else rate_val)
+
+    # We need numeric data for checks
+    # Force numeric, coercing errors to NaN; one contiguous row per column
+    data = np.vstack([pd.to_numeric(df_qc[col], errors='coerce').to_numpy(dtype='float64')
+                      for col in qc_cols])
+    codes = _qc_codes(data, np.array(mins, dtype='float64'), np.array(maxs, dtype='float64'),
+                      np.array(rates, dtype='float64'))
+
+    # Flag columns are plain strings, e.g. "Low", "High Rate", so any flag can
+    # still be assigned later; each code is looked up in the 8 labels.
+    for j, col in enumerate(qc_cols):
+        df_qc[f"{col}_Flag"] = QC_FLAG_LABELS[codes[j]]
+
     return df_qc
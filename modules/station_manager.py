@@ -2,15 +2,31 @@ import json
 import os
 import streamlit as st
 
+try:
+    import orjson  # optional: faster JSON parsing
+except ImportError:
+    orjson = None
+
 CONFIG_FILE = "stations_config.json"
 
+@st.cache_data
+def _load(mtime):
+    # mtime is only the cache key: a changed file gets a fresh parse
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        with open(CONFIG_FILE, "rb") as f:
+            return orjson.loads(f.read())
+    with open(CONFIG_FILE, "r") as f:
+        return json.load(f)
+
 def load_stations():
     """Loads station configurations from the JSON file."""
-    if not os.path.exists(CONFIG_FILE):
+    try:
+        mtime = os.path.getmtime(CONFIG_FILE)
+    except OSError:
         return {}
     try:
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
+        return _load(mtime)
     except json.JSONDecodeError:
         st.error(f"Error reading {CONFIG_FILE}. It might be corrupted.")
         return {}
@@ -18,8 +34,11 @@ def load_stations():
 def save_stations(stations):
     """Saves the station dictionary to the JSON file."""
     try:
+        # Always json (saves are rare): the file keeps one layout whether
+        # or not orjson is installed
         with open(CONFIG_FILE, "w") as f:
             json.dump(stations, f, indent=4)
+        _load.clear()
         st.success("Station configuration saved successfully!")
     except Exception as e:
         st.error(f"Error saving configuration: {e}")
@@ -1,5 +1,32 @@
+import csv
+import functools
+import io
+import zoneinfo
 import pandas as pd
 
+try:
+    import pyarrow.csv as pac  # only for the reader NA strings
+except ImportError:
+    pac = None
+
+# Logger missing-value sentinels, read as NaN by every TOA5/CSV reader
+# (in addition to the default NA strings)
+NA_VALUES = ['NAN', '"NAN"', '', '-7999', '7999']
+SENTINEL_VALUES = [-7999, 7999]
+
+def arrow_null_values():
+    """
+    Returns the null strings for a PyArrow CSV reader that match
+    pd.read_csv(na_values=NA_VALUES, keep_default_na=True): Arrow's defaults
+    lack pandas' 'None' and '<NA>'.
+    """
+    return pac.ConvertOptions().null_values + ['None', '<NA>'] + NA_VALUES
+
+@functools.lru_cache(maxsize=32)
+def _get_tz(name):
+    # Resolve each timezone name once per process
+    return zoneinfo.ZoneInfo(name)
+
 def convert_timezone(df, timestamp_col, from_tz, to_tz):
     """
     Converts a timestamp column from one timezone to another.
@@ -7,22 +34,39 @@ def convert_timezone(df, timestamp_col, from_tz, to_tz):
     if timestamp_col not in df.columns:
         return df
     
+    ts = df[timestamp_col]
     try:
+        from_tz = _get_tz(from_tz) if isinstance(from_tz, str) else from_tz
+        to_tz = _get_tz(to_tz) if isinstance(to_tz, str) else to_tz
+        
+        # Work on a DatetimeIndex: each step is one pass over the int64 array
+        # instead of building an intermediate Series per .dt call
+        idx = pd.DatetimeIndex(ts)
+        
         # localized timestamps (if naive, assume from_tz)
-        if df[timestamp_col].dt.tz is None:
+        if idx.tz is None:
             # Ambiguous times can happen during DST switch; 'infer' often works or raise
-            localized = df[timestamp_col].dt.tz_localize(from_tz, ambiguous='infer', nonexistent='shift_forward')
-        else:
-            localized = df[timestamp_col]
+            idx = idx.tz_localize(from_tz, ambiguous='infer', nonexistent='shift_forward')
             
-        converted = localized.dt.tz_convert(to_tz)
+        converted = idx.tz_convert(to_tz)
         
         # User requested "just one number" (naive timestamp), stripping offset info.
-        return converted.dt.tz_localize(None)
+        return pd.Series(converted.tz_localize(None), index=df.index, name=timestamp_col)
     except Exception as e:
         # Fallback or error logging
         print(f"Timezone conversion error: {e}")
-        return df[timestamp_col]
+        return ts
+
+def write_csv_rows(df, buf):
+    """
+    Writes the rows of df (no header) as CSV into the binary buffer buf, with
+    missing values written as the literal NaN. The text is what
+    df.to_csv(index=False, header=False, na_rep='NaN') returns, encoded as UTF-8.
+    """
+    text = io.TextIOWrapper(buf, encoding='utf-8', newline='', write_through=True)
+    df.to_csv(text, index=False, header=False, na_rep='NaN')
+    text.flush()
+    text.detach()  # leave buf open for the caller
 
 def format_tidy_csv(df, station_config=None, header_info=None, process_codes=None):
     """
@@ -89,18 +133,17 @@ def format_tidy_csv(df, station_config=None, header_info=None, process_codes=Non
     # --- Combine ---
     # We need to construct a CSV string manually for the headers, then append df without header
     
-    # Helper to join CSV line
-    def to_csv_line(items):
-        return ",".join([f'"{str(x)}"' for x in items]) + "\n"
-        
-    csv_str = ""
-    csv_str += to_csv_line(row0)
-    csv_str += to_csv_line(row1)
-    csv_str += to_csv_line(row2)
-    csv_str += to_csv_line(row3)
+    # csv.writer quotes every field and escapes embedded quotes
+    header = io.StringIO()
+    writer = csv.writer(header, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerows([row0, row1, row2, row3])
+    
+    # Header rows and data go into one growing byte buffer
+    buf = io.BytesIO()
+    buf.write(header.getvalue().encode('utf-8'))
     
     # Append Data
     # User requested literal "NaN" for missing values
-    csv_str += df.to_csv(index=False, header=False, na_rep='NaN')
+    write_csv_rows(df, buf)
     
-    return csv_str.encode('utf-8')
+    return buf.getvalue()
@@ -1,9 +1,22 @@
 import pandas as pd
 import numpy as np
 import os
+import re
 import csv
-from datetime import datetime, timedelta, timezone
-from suntime import Sun
+import io
+import logging
+import sys
+
+from modules.utils import NA_VALUES, arrow_null_values, write_csv_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pac  # multi-threaded CSV reader
+except ImportError:
+    pa = None
+    pac = None
+
+logger = logging.getLogger(__name__)
 
 INPUT_FILE = 'data/concatenated_all_years.csv'
 OUTPUT_FILE = 'data/concatenated_all_years_phase2.csv'
@@ -45,6 +58,13 @@ THRESHOLDS = {
     'gtmp_Avg': (-50, 60), 
 }
 
+# THRESHOLDS frozen into parallel arrays for the vectorized range check.
+# Dynamic column references are checked separately, so their slot here is
+# -inf/inf and never triggers.
+THRESHOLD_COLS = list(THRESHOLDS)
+THRESHOLD_MIN = np.array([-np.inf if isinstance(lo, str) else lo for lo, _ in THRESHOLDS.values()], dtype='float64')
+THRESHOLD_MAX = np.array([np.inf if isinstance(hi, str) else hi for _, hi in THRESHOLDS.values()], dtype='float64')
+
 # Dependency Configuration
 DEPENDENCY_CONFIG = [
     # ClimaVue50
@@ -74,6 +94,22 @@ DEPENDENCY_CONFIG = [
 ]
 
 
+def check_dependency_order(rules):
+    """
+    Raises ValueError if a dependency rule runs before another rule that can
+    still set one of its trigger flags on one of its sources. The rules run
+    in list order, so such a rule would miss those flags.
+    """
+    for i, rule in enumerate(rules):
+        for later in rules[i + 1:]:
+            if later['target'] in rule['sources'] and later['set_flag'] in rule['trigger_flags']:
+                raise ValueError(
+                    f"Dependency rule for {rule['target']} must come after the rule "
+                    f"setting {later['set_flag']} on {later['target']}"
+                )
+
+check_dependency_order(DEPENDENCY_CONFIG)
+
 Add_caution_flag = [
     'BattV_Avg', 'PTemp_C_Avg', 'SlrFD_W_Avg', 'Dist_km_Avg', 'WS_ms_Avg', 
     'MaxWS_ms_Avg', 'AirT_C_Avg', 'VP_hPa_Avg', 'BP_hPa_Avg', 'RHT_C_Avg', 
@@ -87,201 +123,350 @@ SOLAR_COLUMNS = [
     'SlrFD_W_Avg', 'SWin_Avg'
 ]
 
+# One bit per known flag code, for testing flag strings with integer masks
+FLAG_BITS = {
+    'T': 1, 'ERR': 2, 'DF': 4, 'Z': 8, 'SU': 16, 'M': 32, 'LR': 64,
+    'C': 128, 'SF': 256, 'NW': 512, 'V': 1024, 'P': 2048
+}
+
+# Every column any phase 2 check can flag
+FLAGGED_COLUMNS = list(dict.fromkeys(
+    ['RECORD', 'WindDir', 'TiltNS_deg_Avg', 'TiltWE_deg_Avg']
+    + list(THRESHOLDS) + Add_caution_flag + SOLAR_COLUMNS
+    + [rule['target'] for rule in DEPENDENCY_CONFIG]
+))
+
+def read_body_arrow(filepath):
+    """
+    Reads the data rows (row 0 names the columns, row 1 holds units) with
+    the PyArrow CSV reader in one multi-threaded pass.
+    Returns None if Arrow cannot type a column consistently.
+    """
+    # Only TIMESTAMP gets an explicit type; the data columns are inferred like
+    # pandas does, so integer-valued columns stay integers in the output
+    convert_options = pac.ConvertOptions(
+        column_types={'TIMESTAMP': pa.timestamp('ns')},
+        null_values=arrow_null_values(),
+        strings_can_be_null=True
+    )
+    try:
+        table = pac.read_csv(
+            filepath,
+            read_options=pac.ReadOptions(skip_rows_after_names=1, block_size=4 << 20),
+            convert_options=convert_options
+        )
+    except pa.ArrowInvalid:
+        return None
+    # All-missing columns come back untyped; pandas reads those as float
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table.to_pandas(split_blocks=True, self_destruct=True, coerce_temporal_nanoseconds=True)
+
+def init_flag_columns(df):
+    """
+    Prepares every flag column up front: missing flag columns for checked
+    columns are added in one concat, and empty flags become "" (not NaN).
+    """
+    missing = [f"{col}_Flag" for col in FLAGGED_COLUMNS
+               if col in df.columns and f"{col}_Flag" not in df.columns]
+    if missing:
+        df = pd.concat([df, pd.DataFrame("", index=df.index, columns=missing)], axis=1)
+    
+    flag_cols = [c for c in df.columns if c.endswith("_Flag")]
+    df[flag_cols] = df[flag_cols].astype(object).fillna("")
+    return df
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def ensure_datetime(ts):
+    """
+    Returns ts as datetime64, parsing only if it is not already typed.
+    Text is parsed with the logger's fixed TIMESTAMP_FORMAT, falling back
+    to format inference for anything else.
+    """
+    if pd.api.types.is_datetime64_any_dtype(ts):
+        return ts
+    try:
+        return pd.to_datetime(ts, format=TIMESTAMP_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(ts)
+
 def load_data(filepath):
-    print(f"Reading {filepath}...")
-    
-    # Read Header and Units separately to preserve them
-    header_df = pd.read_csv(filepath, header=None, nrows=2)
-    headers = header_df.iloc[0].tolist()
-    units = header_df.iloc[1].tolist()
-    df = pd.read_csv(filepath, header=0, skiprows=[1], 
-                     na_values=['NAN', '"NAN"', ''], keep_default_na=True, 
-                     skipinitialspace=True, low_memory=False)
+    logger.info("Reading %s...", filepath)
+    
+    # Read Header and Units separately to preserve them (just the first two lines)
+    with open(filepath, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        # Empty units are written back as "nan", as in the app's CSV exports
+        units = [u if u != "" else "nan" for u in next(reader)]
+    df = read_body_arrow(filepath) if pac is not None else None
+    if df is None:
+        df = pd.read_csv(filepath, header=0, skiprows=[1], 
+                         na_values=NA_VALUES, keep_default_na=True, 
+                         skipinitialspace=True, low_memory=False)
+    # Parse TIMESTAMP once here (Arrow already types it); later stages reuse it
+    if 'TIMESTAMP' in df.columns:
+        df['TIMESTAMP'] = ensure_datetime(df['TIMESTAMP'])
+    df = init_flag_columns(df)
     return df, headers, units
 
-def apply_uniquecases(df):
+def log_flagged(col, mask, what):
+    """Logs how many records of col a check flags; the count is only taken when INFO is enabled."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("  - %s: Flagging %d records %s", col, mask.sum(), what)
+
+def _write_flags(df, flag_col, rows, suffixes):
+    """
+    Appends suffixes[k] to the flag in row position rows[k]: an empty flag
+    becomes the suffix, anything else gets ", suffix" added. Only the selected
+    cells are written, positionally.
+    """
+    if len(rows) == 0:
+        return
+    
+    # Flag columns are object arrays of strings (init_flag_columns). There are
+    # only a few distinct (flag, suffix) pairs, so each new string is built once.
+    current_codes, current = pd.factorize(df[flag_col].to_numpy()[rows])
+    suffix_codes, suffixes = pd.factorize(np.asarray(suffixes, dtype=object))
+    n_suffixes = len(suffixes)
+    pair_codes, pairs = pd.factorize(current_codes * n_suffixes + suffix_codes)
+    new_flags = np.empty(len(pairs), dtype=object)
+    for k, pair in enumerate(pairs):
+        flag, suffix = current[pair // n_suffixes], suffixes[pair % n_suffixes]
+        new_flags[k] = flag + ", " + suffix if flag != "" else suffix
+    df.iloc[rows, df.columns.get_loc(flag_col)] = new_flags[pair_codes]
+
+def append_flag(df, flag_col, mask, flag):
+    """
+    Appends flag to flag_col on the selected rows: an empty flag becomes flag,
+    anything else gets ", flag" added. mask is a boolean mask or an array of
+    row positions.
+    """
+    mask = np.asarray(mask)
+    rows = np.flatnonzero(mask) if mask.dtype == bool else mask
+    _write_flags(df, flag_col, rows, [flag] * len(rows))
+
+def append_flags(df, flag_col, checks):
+    """
+    Appends several flags to flag_col in one pass. checks is a list of
+    (boolean mask, flag) pairs; each row gets the flags of its true masks,
+    in list order, e.g. "T, SF".
+    """
+    # Encode which checks hit each row as bits, then look the suffix up
+    codes = np.zeros(len(df), dtype=np.uint8)
+    for bit, (mask, _) in enumerate(checks):
+        codes |= np.asarray(mask, dtype=bool).astype(np.uint8) << bit
+    rows = np.flatnonzero(codes)
+    if len(rows) == 0:
+        return
+    suffixes = [", ".join(flag for bit, (_, flag) in enumerate(checks) if code >> bit & 1)
+                for code in range(1 << len(checks))]
+    _write_flags(df, flag_col, rows, [suffixes[code] for code in codes[rows]])
+
+def flag_bits(flags):
+    """
+    Returns the FLAG_BITS bitmask of every flag string in flags, e.g.
+    "T, ERR" -> 3. Codes are matched as whole words, so "T,ERR" reads the
+    same. Unknown codes have no bit. Each distinct string is only tokenized
+    once.
+    """
+    codes, uniques = pd.factorize(flags)
+    lookup = np.zeros(len(uniques), dtype=np.uint16)
+    for k, flag in enumerate(uniques):
+        for token in re.findall(r"\w+", flag):
+            lookup[k] |= FLAG_BITS.get(token, 0)
+    return lookup[codes]
+
+def flag_contains(flags, text):
+    """
+    Returns a boolean mask of the flag strings in flags that contain text
+    (a plain substring test). Each distinct string is only checked once.
+    """
+    codes, uniques = pd.factorize(flags)
+    return np.array([text in flag for flag in uniques], dtype=bool)[codes]
+
+def numeric_columns(df):
+    """
+    Coerces every column the checks read to float64 once, handling
+    non-numerics (they become NaN). Returns {col: Series}; the data columns
+    in df are left as they are.
+    """
+    threshold_refs = [limit for limits in THRESHOLDS.values() for limit in limits if isinstance(limit, str)]
+    cols = dict.fromkeys(['RECORD', 'WS_ms_Avg', 'DBTCDT_Avg', 'SWalbedo_Avg', 'TiltNS_deg_Avg', 'TiltWE_deg_Avg']
+                         + list(THRESHOLDS) + threshold_refs + SOLAR_COLUMNS)
+    return {col: (df[col] if pd.api.types.is_numeric_dtype(df[col])
+                  else pd.to_numeric(df[col], errors='coerce')).astype('float64')
+            for col in cols if col in df.columns}
+
+def apply_uniquecases(df, num):
     # Checks the record column, and sees logger reset.
     found_col = "RECORD"
     if found_col:
         col = found_col
-        vals = pd.to_numeric(df[col], errors='coerce')
+        vals = num[col].to_numpy()
         
-        # get your previous value
-        prev_vals = vals.shift(1)
+        # get your previous value (the first row has none)
+        prev_vals = np.empty_like(vals)
+        prev_vals[:1] = np.nan
+        prev_vals[1:] = vals[:-1]
         # see if your first value is "NaN" or if its missing.
-        is_start = vals.shift(1).isna()
+        is_start = np.isnan(prev_vals)
         # Mask where current < previous (Restart) or if the first value is 0.
         mask_restart = (vals < prev_vals) | (is_start & (vals == 0))
         if mask_restart.any():
             flag_col = f"{col}_Flag"
-            if flag_col not in df.columns:
-                df[flag_col] = ""
 
-            print(f"  - {col}: Flagging {mask_restart.sum()} records as 'LR' (Sequence Drop)")
+            log_flagged(col, mask_restart, "as 'LR' (Sequence Drop)")
 
-            # Get current flags
-            current_flags = df[flag_col].fillna("").astype(str)
-            # Get the rows that need to be flagged
-            targets = current_flags.loc[mask_restart]
             # Add LR flag, if the flag is empty, add LR, if it has something, add , LR
-            new_flags = np.where(targets == "", "LR", targets + ", LR")
-            # Update the flags
-            df.loc[mask_restart, flag_col] = new_flags
+            append_flag(df, flag_col, mask_restart, "LR")
 
     return df
 
-def apply_thresholds(df):
-    print("Applying QC Thresholds...")
+def apply_thresholds(df, num):
+    logger.info("Applying QC Thresholds...")
     
-    for col, (min_v, max_v) in THRESHOLDS.items():
+    cols = []
+    present = []
+    for j, col in enumerate(THRESHOLD_COLS):
         if col not in df.columns:
-            print(f"Warning: Column {col} not found in dataset.")
+            logger.warning("Warning: Column %s not found in dataset.", col)
             continue
-            
-        flag_col = f"{col}_Flag"
-        # Create numeric series for comparison, handling non-numerics if any
-        vals = pd.to_numeric(df[col], errors='coerce')
-        
-        # Prepare Limit Values (Handle Dynamic Column References)
+        cols.append(col)
+        present.append(j)
+    if not cols:
+        return df
+    
+    # Create one numeric (rows x columns) block for all checked columns,
+    # handling non-numerics if any
+    vals = np.column_stack([num[col].to_numpy() for col in cols])
+    
+    # Identify Violations for every column at once (NaN never fails)
+    mask_fail = (vals < THRESHOLD_MIN[present]) | (vals > THRESHOLD_MAX[present])
+    
+    # Handle Dynamic Column References
+    for j, col in enumerate(cols):
+        min_v, max_v = THRESHOLDS[col]
         if isinstance(min_v, str) and min_v in df.columns:
-            limit_min = pd.to_numeric(df[min_v], errors='coerce')
-        else:
-            limit_min = min_v
-
+            mask_fail[:, j] |= vals[:, j] < num[min_v].to_numpy()
         if isinstance(max_v, str) and max_v in df.columns:
-            limit_max = pd.to_numeric(df[max_v], errors='coerce')
-        else:
-            limit_max = max_v
-        
-        # Identify Violations
-        mask_fail = (vals < limit_min) | (vals > limit_max)
+            mask_fail[:, j] |= vals[:, j] > num[max_v].to_numpy()
+    
+    for j, col in enumerate(cols):
+        if not mask_fail[:, j].any():
+            continue
+        min_v, max_v = THRESHOLDS[col]
+        flag_col = f"{col}_Flag"
         
         # Check Existing Flags for 'M'
-        # ensure string
-        current_flags = df[flag_col].fillna("").astype(str)
-        mask_has_m = current_flags.str.contains('M')
+        mask_has_m = flag_contains(df[flag_col].to_numpy(), 'M')
         
         # Final Mask: Failed Threshold AND Not Missing
-        mask_apply = mask_fail & (~mask_has_m)
+        mask_apply = mask_fail[:, j] & (~mask_has_m)
         
         # Apply 'T'
         if mask_apply.any():
-            # Count the number of records to be flagged, only for print statement
-            count = mask_apply.sum()
-            print(f"  - {col}: Flagging {count} records outside [{min_v}, {max_v}]")
-            # Get the rows that need to be flagged
-            targets = current_flags.loc[mask_apply]
+            log_flagged(col, mask_apply, f"outside [{min_v}, {max_v}]")
             # Add T flag, if the flag is empty, add T, if it has something, add , T
-            new_flags = np.where(targets == "", "T", targets + ", T")
-            # Update the flags
-            df.loc[mask_apply, flag_col] = new_flags
+            append_flag(df, flag_col, mask_apply, "T")
             
     return df
 
 def apply_legacy_flags(df, target_id="222"):
-    print(f"Applying Legacy 'C' Flags for Data_ID {target_id}...")
+    logger.info("Applying Legacy 'C' Flags for Data_ID %s...", target_id)
     
     # Ensure Data_ID is string for comparison
     if 'Data_ID' not in df.columns:
-        print("Warning: Data_ID column not found. Skipping legacy flags.")
+        logger.warning("Warning: Data_ID column not found. Skipping legacy flags.")
         return df
         
-    mask_legacy = (df['Data_ID'].astype(str) == target_id)
+    # Compare the text of each distinct Data_ID once, as astype(str) would render it
+    # (missing IDs take the last slot and never match)
+    id_codes, ids = pd.factorize(df['Data_ID'])
+    mask_legacy = np.append([str(x) == target_id for x in ids], False)[id_codes]
     
     if not mask_legacy.any():
-        print(f"No records found with Data_ID {target_id}")
+        logger.info("No records found with Data_ID %s", target_id)
         return df
         
-    count = mask_legacy.sum()
-    print(f"Found {count} legacy records.")
+    logger.info("Found %d legacy records.", mask_legacy.sum())
     
     for col in Add_caution_flag:
         if col not in df.columns:
             continue
             
         flag_col = f"{col}_Flag"
-        if flag_col not in df.columns:
-            df[flag_col] = ""
             
-        current_flags = df.loc[mask_legacy, flag_col].fillna("").astype(str)
-        
-        # Append 'C', handling existing flags
-        new_flags = np.where(current_flags == "", "C", current_flags + ", C")
-        
-        df.loc[mask_legacy, flag_col] = new_flags
+        append_flag(df, flag_col, mask_legacy, "C")
         
     return df
 
-def apply_dynamic_thresholds(df):
-    print("Applying Dynamic Thresholds & Logic Flags...")
+def apply_dynamic_thresholds(df, num):
+    logger.info("Applying Dynamic Thresholds & Logic Flags...")
     
     # Ensure TIMESTAMP for seasonal checks
     has_date = 'TIMESTAMP' in df.columns
     if has_date:
-        df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'])
+        df['TIMESTAMP'] = ensure_datetime(df['TIMESTAMP'])
     limit = SENSOR_HEIGHT - 50
     
+    # All masks below are plain boolean arrays over the numeric values
+    # (NaN never fails a comparison)
+    
     # T Check for DBTCDT (Snow Depth)
     if 'DBTCDT_Avg' in df.columns:
-        vals = pd.to_numeric(df['DBTCDT_Avg'], errors='coerce')
+        col = 'DBTCDT_Avg'
+        flag_col = f"{col}_Flag"
+        vals = num[col].to_numpy()
         
         # > H-50 is T (Physical Limit)
         mask_fail = (vals > limit)
         if mask_fail.any():
-            col = 'DBTCDT_Avg'
-            flag_col = f"{col}_Flag"
-            print(f"  - {col}: Flagging {mask_fail.sum()} records > {limit} (H-50)")
-            current_flags = df.loc[mask_fail, flag_col].fillna("").astype(str)
-            new_flags = np.where(current_flags == "", "T", current_flags + ", T")
-            df.loc[mask_fail, flag_col] = new_flags
+            log_flagged(col, mask_fail, f"> {limit} (H-50)")
      
         # Check to make sure that is betwen two dates than in a month
         # looking at months is ok
+        mask_sf = np.zeros(len(df), dtype=bool)
         if has_date:
-            months = df['TIMESTAMP'].dt.month
-            mask_summer = months.isin([6, 7, 8, 9])
+            months = df['TIMESTAMP'].dt.month.to_numpy()
+            mask_summer = np.isin(months, [6, 7, 8, 9])
             mask_snow = (vals > 0)
             mask_sf = mask_summer & mask_snow
             
             if mask_sf.any():
-                col = 'DBTCDT_Avg'
-                flag_col = f"{col}_Flag"
-                print(f"  - {col}: Flagging {mask_sf.sum()} records with 'SF' (Summer Snow)")
-                current_flags = df.loc[mask_sf, flag_col].fillna("").astype(str)
-                new_flags = np.where(current_flags == "", "SF", current_flags + ", SF")
-                df.loc[mask_sf, flag_col] = new_flags
+                log_flagged(col, mask_sf, "with 'SF' (Summer Snow)")
+        
+        # One rewrite of the flag column for both checks (T before SF)
+        append_flags(df, flag_col, [(mask_fail, "T"), (mask_sf, "SF")])
 
     # 3. NV Flag: Wind Speed == 0 -> No Direction
     if 'WS_ms_Avg' in df.columns and 'WindDir' in df.columns:
-        ws = pd.to_numeric(df['WS_ms_Avg'], errors='coerce').fillna(0)
-        mask_calm = (ws == 0)
+        ws = num['WS_ms_Avg'].to_numpy()
+        # Missing speed counts as 0
+        mask_calm = (ws == 0) | np.isnan(ws)
         
         if mask_calm.any():
             col = 'WindDir'
             flag_col = f"{col}_Flag"
-            if flag_col not in df.columns: df[flag_col] = ""
-            print(f"  - {col}: Flagging {mask_calm.sum()} records with 'NW' (No Wind)")
-            current_flags = df.loc[mask_calm, flag_col].fillna("").astype(str)
-            new_flags = np.where(current_flags == "", "NW", current_flags + ", NW")
-            df.loc[mask_calm, flag_col] = new_flags
+            log_flagged(col, mask_calm, "with 'NW' (No Wind)")
+            append_flag(df, flag_col, mask_calm, "NW")
 
     # 5. SU Flag: Albedo (0.1 < Albedo < 0.95 is normal, outside is SU)
     # Thresholds T is < 0 OR > 1.
     # SU is < 0.1 OR > 0.95.
     if 'SWalbedo_Avg' in df.columns:
-        alb = pd.to_numeric(df['SWalbedo_Avg'], errors='coerce')
+        alb = num['SWalbedo_Avg'].to_numpy()
         mask_su = (alb < 0.1) | (alb > 0.95)
         
         if mask_su.any():
             col = 'SWalbedo_Avg'
             flag_col = f"{col}_Flag"
-            if flag_col not in df.columns: df[flag_col] = ""
             
     
-            print(f"  - {col}: Flagging {mask_su.sum()} records with 'SU' (Extreme Albedo)")
-            current_flags = df.loc[mask_su, flag_col].fillna("").astype(str)
-            new_flags = np.where(current_flags == "", "SU", current_flags + ", SU")
-            df.loc[mask_su, flag_col] = new_flags
+            log_flagged(col, mask_su, "with 'SU' (Extreme Albedo)")
+            append_flag(df, flag_col, mask_su, "SU")
 
     # 6. Tilt Checks (Moved from static thresholds)
     # T Flag if |val| > 10
@@ -289,48 +474,36 @@ def apply_dynamic_thresholds(df):
     tilt_cols = ['TiltNS_deg_Avg', 'TiltWE_deg_Avg']
     for col in tilt_cols:
         if col in df.columns:
-            vals = pd.to_numeric(df[col], errors='coerce')
+            abs_vals = np.abs(num[col].to_numpy())
+            flag_col = f"{col}_Flag"
             
             # T Flag (> 10 or < -10)
-            mask_t = (vals.abs() > 10)
+            mask_t = (abs_vals > 10)
             if mask_t.any():
-                flag_col = f"{col}_Flag"
-                if flag_col not in df.columns: df[flag_col] = ""
-                
-                print(f"  - {col}: Flagging {mask_t.sum()} records with 'T' (Tilt > 10)")
-                current_flags = df.loc[mask_t, flag_col].fillna("").astype(str)
-                new_flags = np.where(current_flags == "", "T", current_flags + ", T")
-                df.loc[mask_t, flag_col] = new_flags
+                log_flagged(col, mask_t, "with 'T' (Tilt > 10)")
                 
             # SU Flag (3 < |val| <= 10)
-            mask_su = (vals.abs() > 3) & (vals.abs() <= 10)
+            mask_su = (abs_vals > 3) & (abs_vals <= 10)
             if mask_su.any():
-                flag_col = f"{col}_Flag"
-                if flag_col not in df.columns: df[flag_col] = ""
-                
-                print(f"  - {col}: Flagging {mask_su.sum()} records with 'SU' (Tilt > 3)")
-                current_flags = df.loc[mask_su, flag_col].fillna("").astype(str)
-                new_flags = np.where(current_flags == "", "SU", current_flags + ", SU")
-                df.loc[mask_su, flag_col] = new_flags
+                log_flagged(col, mask_su, "with 'SU' (Tilt > 3)")
+            
+            # One rewrite of the flag column for both checks
+            append_flags(df, flag_col, [(mask_t, "T"), (mask_su, "SU")])
 
     return df
 
 def apply_critical_flags(df):
-    print("Checking Critical Flags (PTemp)...")
+    logger.info("Checking Critical Flags (PTemp)...")
     if 'PTemp_C_Avg' not in df.columns:
         return df
         
     # Check if PTemp has 'T' flag
     ptemp_flag_col = 'PTemp_C_Avg_Flag'
-    if ptemp_flag_col not in df.columns:
-        return df
-        
-    current_ptemp_flags = df[ptemp_flag_col].fillna("").astype(str)
     # Mask of rows where PTemp is T. (Using exact match for safety)
-    mask_critical = current_ptemp_flags.str.contains(r'\bT\b', regex=True)
+    mask_critical = (flag_bits(df[ptemp_flag_col].to_numpy()) & FLAG_BITS['T']) != 0
     
     if mask_critical.any():
-        print(f"CRITICAL: Found {mask_critical.sum()} records with PTemp Failure. Flagging ALL columns with ERR.")
+        logger.info("CRITICAL: Found %d records with PTemp Failure. Flagging ALL columns with ERR.", mask_critical.sum())
         
         # Apply ERR to ALL other parameters defined in THRESHOLDS
         for col in THRESHOLDS.keys():
@@ -338,16 +511,17 @@ def apply_critical_flags(df):
             if col not in df.columns: continue
             
             flag_col = f"{col}_Flag"
-            if flag_col not in df.columns: df[flag_col] = ""
             
-            current_flags = df.loc[mask_critical, flag_col].fillna("").astype(str)
-            new_flags = np.where(current_flags == "", "ERR", current_flags + ", ERR")
-            df.loc[mask_critical, flag_col] = new_flags
+            append_flag(df, flag_col, mask_critical, "ERR")
             
     return df
 
 def apply_dependencies(df):
-    print("Applying Dependency Flags...")
+    logger.info("Applying Dependency Flags...")
+    
+    # Bitmasks of the flag columns read so far, kept in step with the strings
+    # as rules add flags (later rules see flags set by earlier ones)
+    bits = {}
     
     for config in DEPENDENCY_CONFIG:
         target_col = config['target']
@@ -359,49 +533,47 @@ def apply_dependencies(df):
             continue
             
         target_flag_col = f"{target_col}_Flag"
-        if target_flag_col not in df.columns:
-             df[target_flag_col] = ""
 
+        # Sources that can trigger this rule; skip the rule if there are none
+        src_flag_cols = [f"{src}_Flag" for src in source_cols
+                         if src in df.columns and f"{src}_Flag" in df.columns]
+        if not src_flag_cols:
+            continue
+
+        # Combined bit of the trigger flags
+        trigger = 0
+        for f in trigger_flags:
+            trigger |= FLAG_BITS[f]
+        
         # Check sources
-        dependency_fail_mask = pd.Series(False, index=df.index)
+        dependency_fail_mask = np.zeros(len(df), dtype=bool)
         
-        for src in source_cols:
-            if src not in df.columns:
-                continue
-            
-            src_flag_col = f"{src}_Flag"
-            if src_flag_col not in df.columns:
-                continue
-                
-            current_src_flags = df[src_flag_col].fillna("").astype(str)
-            
-            # Construct regex for trigger flags
-            pattern = "|".join([rf"\b{f}\b" for f in trigger_flags])
+        for src_flag_col in src_flag_cols:
+            if src_flag_col not in bits:
+                bits[src_flag_col] = flag_bits(df[src_flag_col].to_numpy())
             
-            has_error = current_src_flags.str.contains(pattern, regex=True)
-            dependency_fail_mask = dependency_fail_mask | has_error
+            has_error = (bits[src_flag_col] & trigger) != 0
+            dependency_fail_mask |= has_error
             
         if dependency_fail_mask.any():
-            count = dependency_fail_mask.sum()
-            # print(f"  - {target_col}: Flagging {count} records with {set_flag} (Dep)")
+            # print(f"  - {target_col}: Flagging {dependency_fail_mask.sum()} records with {set_flag} (Dep)")
             
-            current_flags = df.loc[dependency_fail_mask, target_flag_col].fillna("").astype(str)
-            new_flags = np.where(current_flags == "", set_flag, current_flags + ", " + set_flag)
-            df.loc[dependency_fail_mask, target_flag_col] = new_flags
+            append_flag(df, target_flag_col, dependency_fail_mask, set_flag)
+            if target_flag_col in bits:
+                bits[target_flag_col][dependency_fail_mask] |= FLAG_BITS[set_flag]
             
     return df
 
 def apply_pass_flags(df):
-    print("Applying Universal Pass (P) flags...")
+    logger.info("Applying Universal Pass (P) flags...")
     for col in df.columns:
         if col.endswith("_Flag"):
             data_col = col[:-5] # remove '_Flag' suffix
             if data_col in df.columns:
-                # Ensure we treat NaN/None as empty string for checking flags
-                current_flags = df[col].fillna("").astype(str).str.strip()
-                # Treat "nan" text as empty too just in case
-                # clean potentially "nan" strings if they exist as string 'nan'
-                current_flags = current_flags.replace('nan', '')
+                # Flags are strings (init_flag_columns); blank or "nan" text counts
+                # as no flag too. Each distinct flag is checked once.
+                flag_codes, flags = pd.factorize(df[col].to_numpy())
+                no_flag = np.array([flag.strip() in ("", "nan") for flag in flags], dtype=bool)[flag_codes]
                 
                 # Check if data exists in the data column (not NaN)
                 data_vals = df[data_col]
@@ -409,138 +581,157 @@ def apply_pass_flags(df):
                 # Condition 1: No existing flag (flag is empty string)
                 # Condition 2: Data is present (not NA, not empty string, not 'nan' string)
                 # We do strict checking to avoid flagging missing data as P
-                mask_p = (current_flags == "") & \
-                         (data_vals.notna()) & \
-                         (data_vals.astype(str).str.strip() != '') & \
-                         (data_vals.astype(str).str.lower() != 'nan')
+                mask_p = no_flag & data_vals.notna().to_numpy()
+                if not pd.api.types.is_numeric_dtype(data_vals):
+                    # Only text columns can hold '' or 'nan' strings
+                    mask_p &= ((data_vals.astype(str).str.strip() != '') &
+                               (data_vals.astype(str).str.lower() != 'nan')).to_numpy()
                 
                 if mask_p.any():
                     # This assigns 'P' to the rows where no other flag exists and valid data is present
-                    df.loc[mask_p, col] = 'P'
+                    # (written positionally, only into the selected cells)
+                    df.iloc[np.flatnonzero(mask_p), df.columns.get_loc(col)] = 'P'
     return df
 
-def apply_nighttime_flags(df):
-    print("Applying Nighttime 'Z' Flags for Solar Data...")
+def sun_event_times(days, lat, lon, is_rise_time, zenith=90.8):
+    """
+    Sunrise (or sunset) in UTC for an array of datetime64[D] days, using the
+    same approximation as suntime.Sun (including its 0.01 h rounding), so the
+    times match it exactly. Days without the event are NaT.
+    """
+    to_rad = np.pi / 180.0
+    lng_hour = lon / 15
+    
+    # 1. day of the year, 2. approximate time
+    N = (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+    t = N + (((6 if is_rise_time else 18) - lng_hour) / 24)
+    
+    # 3. Sun's mean anomaly and true longitude in [0, 360)
+    M = (0.9856 * t) - 3.289
+    L = M + (1.916 * np.sin(to_rad * M)) + (0.020 * np.sin(to_rad * 2 * M)) + 282.634
+    L = np.where(L < 0, L + 360, np.where(L >= 360, L - 360, L))
+    
+    # 4. declination and local hour angle (|cosH| > 1: polar day/night)
+    sinDec = 0.39782 * np.sin(to_rad * L)
+    cosDec = np.cos(np.arcsin(sinDec))
+    cosH = (np.cos(to_rad * zenith) - (sinDec * np.sin(to_rad * lat))) / (cosDec * np.cos(to_rad * lat))
+    valid = (cosH >= -1) & (cosH <= 1)
+    acosH = (1 / to_rad) * np.arccos(np.clip(cosH, -1, 1))
+    H = (360 - acosH if is_rise_time else acosH) / 15
+    
+    # 5. right ascension in [0, 360), in the same quadrant as L, in hours
+    RA = (1 / to_rad) * np.arctan(0.91764 * np.tan(to_rad * L))
+    RA = np.where(RA < 0, RA + 360, np.where(RA >= 360, RA - 360, RA))
+    RA = (RA + (np.floor(L / 90) * 90 - np.floor(RA / 90) * 90)) / 15
+    
+    # 6. local mean time, 7. UTC rounded to hundredths of an hour in [0, 24)
+    T = H + RA - (0.06571 * t) - 6.622
+    hundredths = np.rint((T - lng_hour) * 100).astype(np.int64)
+    hundredths = np.where(hundredths < 0, hundredths + 2400,
+                          np.where(hundredths >= 2400, hundredths - 2400, hundredths))
+    utc_day_offset = -np.floor((hundredths / 100 + lng_hour) / 24).astype(np.int64)
+    
+    times = (days.astype('datetime64[ns]') + utc_day_offset.astype('timedelta64[D]')
+             + (hundredths * 36).astype('timedelta64[s]'))
+    return np.where(valid, times, np.datetime64('NaT'))
+
+def apply_nighttime_flags(df, num):
+    logger.info("Applying Nighttime 'Z' Flags for Solar Data...")
     latitude = 53.7217
     longitude = -125.6417
 
-    sun = Sun(latitude, longitude)
-    
     # 1. Ensure TIMESTAMP is datetime
     if 'TIMESTAMP' not in df.columns:
-        print("Error: TIMESTAMP column missing.")
+        logger.error("Error: TIMESTAMP column missing.")
+        return df
+    
+    # Nothing to check without solar columns; skip the sunrise/sunset work
+    solar_cols = [col for col in SOLAR_COLUMNS if col in df.columns]
+    if not solar_cols:
+        logger.info("Flagged 0 solar records with 'Z'.")
         return df
         
     # Ensure datetime objects
-    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'])
+    df['TIMESTAMP'] = ensure_datetime(df['TIMESTAMP'])
     
     # 2. Define Timezone: Fixed PDT (UTC-7)
     # The data is in PDT year-round.
-    tz_pdt = timezone(timedelta(hours=-7))
+    pdt_offset = np.timedelta64(-7, 'h')
+    
+    # 3. Calculate sunrise/set for all unique dates at once, keyed by
+    # datetime64[D] days rather than Python date objects
+    # (date code -1, i.e. a missing timestamp, picks the NaT in the last slot)
+    ts_values = df['TIMESTAMP'].to_numpy(dtype='datetime64[ns]')
+    date_codes, days = pd.factorize(ts_values.astype('datetime64[D]'))
+    days = days.astype('datetime64[D]')
+    rise_times = np.full(len(days), np.datetime64('NaT'), dtype='datetime64[ns]')
+    set_times = rise_times.copy()
+    
+    # Check current day and next day to capture events that cross UTC midnight;
+    # an event counts for a date when it falls on that date in PDT
+    for cand in (days, days + 1):
+        r_pdt = sun_event_times(cand, latitude, longitude, is_rise_time=True) + pdt_offset
+        s_pdt = sun_event_times(cand, latitude, longitude, is_rise_time=False) + pdt_offset
+        # No sunrise (polar night/day): the sunset of that candidate is not used either
+        s_pdt[np.isnat(r_pdt)] = np.datetime64('NaT')
+        
+        rise_match = r_pdt.astype('datetime64[D]') == days
+        set_match = s_pdt.astype('datetime64[D]') == days
+        rise_times[rise_match] = r_pdt[rise_match]
+        set_times[set_match] = s_pdt[set_match]
     
-    # 3. Iterate by unique dates to calculate sunrise/set
-    # Create a column for just the date component to iterate
-    temp_dates = df['TIMESTAMP'].dt.date
-    unique_dates = temp_dates.unique()
+    # Verify we found both times; otherwise the date stays NaT (never night)
+    missing = np.isnat(rise_times) | np.isnat(set_times)
+    rise_times[missing] = np.datetime64('NaT')
+    set_times[missing] = np.datetime64('NaT')
+    rise_times = np.append(rise_times, np.datetime64('NaT'))
+    set_times = np.append(set_times, np.datetime64('NaT'))
+
+    # Night Mask over all rows: Time < Rise OR Time > Set
+    # User requested 15 minute padding from both ends (Z flag starts too early/ends too late).
+    # This expands the "Day" window by 15 mins on each side.
+    padding = np.timedelta64(15, 'm')
+    mask_night = ((ts_values < rise_times[date_codes] - padding)
+                  | (ts_values > set_times[date_codes] + padding))
     
     records_flagged = 0
     
-    for d in unique_dates:
-        # Search for correct sunrise/sunset for this local date
-        rise_naive = None
-        set_naive = None
+    # Check Solar Columns for Non-Zero (using small epsilon; NaN compares False,
+    # i.e. counts as zero) directly on the cached float64 arrays
+    for col in solar_cols:
+        mask_z = mask_night & (np.abs(num[col].to_numpy()) > 0.0001)
         
-        # Check current day and next day to capture events that cross UTC midnight
-        candidates = [datetime(d.year, d.month, d.day), datetime(d.year, d.month, d.day) + timedelta(days=1)]
-        
-        for cand in candidates:
-            try:
-                # Check Sunrise
-                r_utc = sun.get_sunrise_time(cand)
-                r_pdt = r_utc.astimezone(tz_pdt)
-                if r_pdt.date() == d:
-                    rise_naive = r_pdt.replace(tzinfo=None)
-                
-                # Check Sunset
-                s_utc = sun.get_sunset_time(cand)
-                s_pdt = s_utc.astimezone(tz_pdt)
-                if s_pdt.date() == d:
-                    set_naive = s_pdt.replace(tzinfo=None)
-            except Exception as e:
-                # Polar night/day or calculation error
-                continue
-        
-        # Mask for this date
-        mask_date = (temp_dates == d)
-        
-        # Get the timestamps for this date
-        ts_values = df.loc[mask_date, 'TIMESTAMP']
-        
-        # Verify we found both times
-        if rise_naive is None or set_naive is None:
-            # print(f"Warning: Could not determine sunrise/sunset for {d} (Polar Day/Night?)")
-            continue
-
-        # Night Mask: Time < Rise OR Time > Set
-        # User requested 15 minute padding from both ends (Z flag starts too early/ends too late).
-        # This expands the "Day" window by 15 mins on each side.
-        padding = timedelta(minutes=15)
-        mask_night_time = (ts_values < (rise_naive - padding)) | (ts_values > (set_naive + padding))
-        
-        # Get indices
-        night_index_subset = ts_values[mask_night_time].index
-        
-        if len(night_index_subset) == 0:
-            continue
-            
-        # Check Solar Columns for Non-Zero
-        for col in SOLAR_COLUMNS:
-            if col not in df.columns:
-                continue
-                
-            # Get values for night rows
-            vals = pd.to_numeric(df.loc[night_index_subset, col], errors='coerce').fillna(0)
-            
-            # Non-zero mask (using small epsilon)
-            mask_nonzero = (vals.abs() > 0.0001)
-            
-            if mask_nonzero.any():
-                target_indices = vals[mask_nonzero].index
-                
-                flag_col = f"{col}_Flag"
-                if flag_col not in df.columns:
-                    df[flag_col] = ""
-                    
-                current_flags = df.loc[target_indices, flag_col].fillna("").astype(str)
-                new_flags = np.where(current_flags == "", "Z", current_flags + ", Z")
-                
-                df.loc[target_indices, flag_col] = new_flags
-                records_flagged += len(target_indices)
+        flag_col = f"{col}_Flag"
+        append_flag(df, flag_col, mask_z, "Z")
+        records_flagged += int(mask_z.sum())
 
-    print(f"Flagged {records_flagged} solar records with 'Z'.")
+    logger.info("Flagged %d solar records with 'Z'.", records_flagged)
     return df
 
 def main():
     if not os.path.exists(INPUT_FILE):
-        print(f"Error: Input file {INPUT_FILE} not found.")
+        logger.error("Error: Input file %s not found.", INPUT_FILE)
         return
 
     # 1. Load
     df, headers, units = load_data(INPUT_FILE)
-    print(f"Loaded {len(df)} rows.")
+    logger.info("Loaded %d rows.", len(df))
+    
+    # Numeric values of the checked columns, coerced once for all checks
+    num = numeric_columns(df)
     
     # 2. Apply Thresholds (Static Min/Max)
-    df = apply_thresholds(df)
+    df = apply_thresholds(df, num)
     
     # 3. Apply Dynamic Thresholds & Nighttime
-    df = apply_dynamic_thresholds(df)
-    df = apply_nighttime_flags(df)
+    df = apply_dynamic_thresholds(df, num)
+    df = apply_nighttime_flags(df, num)
     
     # 4. Critical Flags (PTemp Failure)
     df = apply_critical_flags(df)
     
     # 5. Apply Unique Cases & Legacy
-    df = apply_uniquecases(df)
+    df = apply_uniquecases(df, num)
     df = apply_legacy_flags(df)
 
     # 6. Apply Dependencies (Checks T, ERR, Z set above)
@@ -549,15 +740,13 @@ def main():
     # 7. Apply Pass (P) Flags (After all other flags are set)
     df = apply_pass_flags(df)
     
-    # 4. Cleanup Flags (Ensure empty flags are "" not NaN)
-    flag_cols = [c for c in df.columns if c.endswith("_Flag")]
-    df[flag_cols] = df[flag_cols].fillna("")
-
     # 5. Save
-    print(f"Saving to {OUTPUT_FILE}...")
+    logger.info("Saving to %s...", OUTPUT_FILE)
     
-    with open(OUTPUT_FILE, 'w', newline='') as f:
-        writer = csv.writer(f)
+    # One handle for the header rows and the body (large buffer, single sequential write)
+    with open(OUTPUT_FILE, 'wb', buffering=1 << 20) as f:
+        header = io.StringIO()
+        writer = csv.writer(header)
         writer.writerow(df.columns) # Header
         # Units row - Need to map current columns to units
         # The units list corresponds to the ORIGINAL headers
@@ -572,9 +761,12 @@ def main():
             current_units.append(u)
             
         writer.writerow(current_units)
+        f.write(header.getvalue().encode('utf-8'))
         
-    df.to_csv(OUTPUT_FILE, mode='a', header=False, index=False, na_rep='NaN')
-    print("Done!")
+        write_csv_rows(df, f)
+    logger.info("Done!")
 
 if __name__ == "__main__":
+    # Plain messages on stdout, as before
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     main()
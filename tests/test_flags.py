@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import phase_2
+
+def flag_frame(flags):
+    return pd.DataFrame({"AirT_C_Avg_Flag": np.array(flags, dtype=object)})
+
+def test_append_flag_adds_tokens():
+    df = flag_frame(["", "M", "T", "", "C, DF"])
+    
+    phase_2.append_flag(df, "AirT_C_Avg_Flag", np.array([True, True, False, False, True]), "T")
+    
+    # Empty flags become the token, others get ", token"; unselected rows are untouched
+    assert df["AirT_C_Avg_Flag"].tolist() == ["T", "M, T", "T", "", "C, DF, T"]
+
+def test_append_flag_accepts_row_positions():
+    df = flag_frame(["", "ERR", ""])
+    
+    phase_2.append_flag(df, "AirT_C_Avg_Flag", np.array([1, 2]), "Z")
+    
+    assert df["AirT_C_Avg_Flag"].tolist() == ["", "ERR, Z", "Z"]
+
+def test_repeated_flags_are_built_once_and_written_everywhere():
+    # Many rows share a few distinct (flag, suffix) pairs
+    flags = ["", "M", "T, SF"] * 1000
+    df = flag_frame(flags)
+    
+    phase_2.append_flag(df, "AirT_C_Avg_Flag", np.ones(len(flags), dtype=bool), "ERR")
+    
+    assert df["AirT_C_Avg_Flag"].tolist() == ["ERR", "M, ERR", "T, SF, ERR"] * 1000
+    # An existing token is appended again, as the string concatenation always did
+    phase_2.append_flag(df, "AirT_C_Avg_Flag", np.array([0]), "ERR")
+    assert df["AirT_C_Avg_Flag"][0] == "ERR, ERR"
+
+def test_append_flags_keeps_check_order():
+    df = flag_frame(["", "M", "", "C"])
+    checks = [
+        (np.array([True, False, True, True]), "T"),
+        (np.array([True, True, False, True]), "SF"),
+    ]
+    
+    phase_2.append_flags(df, "AirT_C_Avg_Flag", checks)
+    
+    assert df["AirT_C_Avg_Flag"].tolist() == ["T, SF", "M, SF", "T", "C, T, SF"]
+
+def test_flag_bits_reads_whole_codes():
+    flags = np.array(["", "T", "T, ERR", "C, DF", "T,ERR", "ERR", "V, P", "LR"], dtype=object)
+    bits = phase_2.flag_bits(flags)
+    FB = phase_2.FLAG_BITS
+    
+    assert bits.tolist() == [0, FB["T"], FB["T"] | FB["ERR"], FB["C"] | FB["DF"],
+                             FB["T"] | FB["ERR"], FB["ERR"], FB["V"] | FB["P"], FB["LR"]]
+    # The trigger test the dependency rules use
+    assert (bits & FB["T"] != 0).tolist() == [False, True, True, False, True, False, False, False]
+
+def test_flag_contains_multi_token_strings():
+    flags = np.array(["C, DF", "DF", "C", "", "M, V", "C, DF"], dtype=object)
+    
+    assert phase_2.flag_contains(flags, "DF").tolist() == [True, True, False, False, False, True]
+    assert phase_2.flag_contains(flags, "C").tolist() == [True, False, True, False, False, True]
+    # A plain substring test: "M" is found inside "M, V"
+    assert phase_2.flag_contains(flags, "M").tolist() == [False, False, False, False, True, False]
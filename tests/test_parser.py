@@ -0,0 +1,34 @@
+import io
+import pandas as pd
+import modules.parser as parser
+
+TOA5 = "\n".join([
+    '"TOA5","Station","CR350","1379","CR350.Std.01","CPU:prog.CRB","123","Table1"',
+    '"TIMESTAMP","RECORD","AirT_C_Avg","RH","MaxWS_ms_TMx","Empty","Status"',
+    '"TS","RN","Deg C","%","","",""',
+    '"","","Avg","Smp","TMx","Smp",""',
+    '"2024-05-24 08:15:00",0,12.5,-7999,"2024-05-24 08:02:00",NAN,"ok"',
+    '"2024-05-24 08:30:00",1,-7999.0,55,"2024-05-24 08:21:00",NAN,NAN',
+    '"2024-05-24 08:45:00",2,NAN,7999,NAN,,"None"',
+    '"2024-05-24 09:00:00",3,13.25,60,"2024-05-24 08:50:00",7999,""',
+]) + "\n"
+
+def parse(monkeypatch, use_arrow):
+    if not use_arrow:
+        monkeypatch.setattr(parser, "pac", None)
+    df, metadata, header_info, process_codes, error = parser.parse_toa5(io.BytesIO(TOA5.encode("utf-8")))
+    assert error is None
+    return df, metadata
+
+def test_arrow_and_pandas_paths_match(monkeypatch):
+    df_arrow, meta_arrow = parse(monkeypatch, use_arrow=True)
+    df_pandas, meta_pandas = parse(monkeypatch, use_arrow=False)
+    
+    pd.testing.assert_frame_equal(df_arrow, df_pandas)
+    assert meta_arrow == meta_pandas
+
+    # Sentinels are missing in any spelling; dates in data columns stay text
+    assert df_arrow["AirT_C_Avg"].isna().tolist() == [False, True, True, False]
+    assert df_arrow["RH"].isna().tolist() == [True, False, True, False]
+    assert df_arrow["MaxWS_ms_TMx"][0] == "2024-05-24 08:02:00"
+    assert df_arrow["Empty"].dtype == "float64"
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+import phase_2
+
+suntime = pytest.importorskip("suntime")
+
+# The station, the tropics, the southern hemisphere and both polar regions
+LOCATIONS = [(53.7217, -125.6417), (0.0, 0.0), (-33.9, 151.2), (69.65, 18.96), (78.22, 15.65), (-77.85, 166.67)]
+
+def suntime_events(lat, lon, days, is_rise_time):
+    sun = suntime.Sun(lat, lon)
+    get_time = sun.get_sunrise_time if is_rise_time else sun.get_sunset_time
+    times = []
+    for day in days.astype(object):
+        try:
+            times.append(np.datetime64(get_time(day).replace(tzinfo=None), 'ns'))
+        except suntime.SunTimeException:
+            # Polar day or night
+            times.append(np.datetime64('NaT'))
+    return np.array(times, dtype='datetime64[ns]')
+
+@pytest.mark.parametrize("lat, lon", LOCATIONS)
+def test_sun_event_times_match_suntime(lat, lon):
+    days = np.arange(np.datetime64('2020-01-01'), np.datetime64('2026-01-01'), 3)
+    for is_rise_time in (True, False):
+        expected = suntime_events(lat, lon, days, is_rise_time)
+        actual = phase_2.sun_event_times(days, lat, lon, is_rise_time)
+        np.testing.assert_array_equal(actual, expected)
+        if abs(lat) > 66.6:
+            # Polar day/night is covered
+            assert np.isnat(actual).any()
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from modules.utils import format_tidy_csv
+
+def test_tidy_csv_rows_match_to_csv():
+    # Daily, tz-aware and sub-second timestamps, whole floats and quoted text
+    df = pd.DataFrame({
+        "TIMESTAMP": pd.date_range("2024-01-01", periods=3, freq="D"),
+        "Local": pd.date_range("2024-01-01 08:00", periods=3, freq="h", tz="America/Vancouver"),
+        "Fine": pd.date_range("2024-01-01", periods=3, freq="250ms"),
+        "RECORD": [0.0, 1.0, np.nan],
+        "Value": [1e-07, 12.5, 7999.0],
+        "Flag": ["C, DF", "", None],
+        "Ok": [True, False, True],
+    })
+    
+    out = format_tidy_csv(df, {"id": "02FW005"})
+    body = out.decode("utf-8").split("\n", 4)[4]
+    assert body == df.to_csv(index=False, header=False, na_rep="NaN")